@@ -0,0 +1,38 @@
+"""
+_docker_http.py
+===============
+Shared Docker Engine API connection for the scripts in this directory.
+- One module-level docker.from_env() client. Its API client is a requests.Session
+  over /var/run/docker.sock with a pooled, keep-alive HTTP/1.1 adapter, so every
+  call in a process reuses the same connections instead of opening new ones.
+- request() sends raw Engine API calls (existence checks, stats, ...) through
+  that same session.
+"""
+
+import logging
+
+import docker
+
+# Enough pooled connections for the concurrent stats fetches in monitor.py
+MAX_POOL_SIZE = 32
+
+try:
+    client = docker.from_env(max_pool_size=MAX_POOL_SIZE)
+except Exception as e:
+    client = None
+    # Named logger: the root logger would run basicConfig() before the scripts configure it
+    logging.getLogger(__name__).warning(f"Could not initialize Docker client: {e}")
+
+
+def request(method, path, *args, **kwargs):
+    """
+    Send an Engine API request (GET, POST, PUT or DELETE) over the shared session
+    and return the decoded JSON, or None for empty responses. `path` is formatted
+    with the quoted `args`, e.g. request("GET", "/containers/{0}/json", name).
+    Raises docker.errors.NotFound / APIError like the Docker SDK does.
+    """
+    api = client.api
+    send = getattr(api, f"_{method.lower()}")
+    response = send(api._url(path, *args), **kwargs)
+    api._raise_for_status(response)
+    return response.json() if response.content else None
@@ -4,18 +4,44 @@ create_container.py
 ===================
 Creates a new Docker container from a plan-specific Dockerfile.
 Features:
-- Builds Docker image if not exists.
+- Talks to the Docker daemon through the Docker SDK (docker-py).
+- Builds Docker image if not exists (with BuildKit).
+- Can pre-build the images of all plans in parallel (--build-all).
 - Creates a Docker bridge network.
-- Optionally creates a host dummy interface for subnet routing.
+- Optionally creates a host dummy interface for subnet routing
+  (over netlink with pyroute2 when installed, otherwise with `ip`).
 - Avoids container name conflicts.
+- Publishes ports on random free host ports, fixed for the container's life.
 """
 
+import errno
+import fcntl
+import json
 import os
 import random
+import re
+import socket
+import struct
 import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
+from docker.errors import APIError
+from docker.types import IPAMConfig, IPAMPool
 
-DOCKERFILES_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "../Dockerfiles")
+from _docker_http import client as docker_client, request
+
+# Optional: configure the host interface over netlink instead of running `ip`
+try:
+    from pyroute2 import IPRoute
+except ImportError:
+    IPRoute = None
+
+SIOCGIFFLAGS = 0x8913
+IFNAMSIZ = 16
+
+
+DOCKERFILES_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "../DockerFiles")
 
 PLANS = {
     "vStart": {"cpu": "1", "mem": "4g", "dockerfile": "Dockerfile.vStart"},
@@ -24,46 +50,143 @@ PLANS = {
     "vStable": {"cpu": "8", "mem": "32g", "dockerfile": "Dockerfile.vStable"},
 }
 
+# Host port range for each published container port
+PORT_RANGES = {
+    "80/tcp": (20000, 30000),
+    "443/tcp": (30001, 40000),
+    "22/tcp": (40001, 50000),
+    "3306/tcp": (50001, 60000),
+}
+# Attempts with newly picked ports when one was taken between the check and the bind
+PORT_ATTEMPTS = 5
+
+
+def listening_ports():
+    """Return the set of TCP ports currently listening on the host (one `ss` call)."""
+    try:
+        output = subprocess.run(["ss", "-ltnH"], check=True, capture_output=True, text=True).stdout
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"Could not list listening ports, assuming none are in use: {e}")
+        return set()
+    used = set()
+    for line in output.splitlines():
+        fields = line.split()
+        if len(fields) >= 4:
+            try:
+                used.add(int(fields[3].rsplit(":", 1)[1]))
+            except (IndexError, ValueError):
+                pass # Silently ignore unparsable addresses
+    return used
+
+
+def random_port(start=20000, end=50000, used=frozenset()):
+    """Pick a random free port in the given range, skipping ports in `used`."""
+    free = [port for port in range(start, end + 1) if port not in used]
+    if not free:
+        raise RuntimeError(f"No free port left in range {start}-{end}")
+    return random.choice(free)
+
+
+def pick_host_ports():
+    """Pick a free host port for each published container port (see PORT_RANGES)."""
+    used = listening_ports()
+    return {container_port: random_port(start, end, used) for container_port, (start, end) in PORT_RANGES.items()}
+
 
-def random_port(start=20000, end=50000):
-    """Generate a random port in the given range."""
-    return random.randint(start, end)
+def is_port_conflict(error):
+    """Whether a Docker API error means a chosen host port was already taken."""
+    message = str(error).lower()
+    return "port is already allocated" in message or "address already in use" in message
 
 
 def run_command(command):
-    """ Helper to run a command and handle errors """
+    """ Helper to run a command (list of arguments, no shell) and handle errors """
     try:
-        result = subprocess.run(command, shell=True, check=True, capture_output=True, text=True)
+        result = subprocess.run(command, check=True, capture_output=True, text=True)
         return result.stdout.strip() # Return stripped stdout
-    except subprocess.CalledCalledProcessError as e:
-        print(f"Error occurred while running command: {command}")
+    except subprocess.CalledProcessError as e:
+        print(f"Error occurred while running command: {' '.join(command)}")
         print(f"Exit Code: {e.returncode}")
         print(f"Error Output: {e.stderr}")
         raise  # Reraise the exception to stop execution
 
 
+def run_command_streaming(command, env=None, prefix=""):
+    """
+    Helper to run a long command, echoing its output live instead of buffering it.
+    Every line is prefixed with `prefix`, so concurrent commands can be told apart.
+    """
+    process = subprocess.Popen(
+        command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1, env=env
+    )
+    for line in process.stdout:
+        sys.stdout.write(f"{prefix}{line}")
+    returncode = process.wait()
+    if returncode != 0:
+        print(f"{prefix}Error occurred while running command: {' '.join(command)}")
+        print(f"{prefix}Exit Code: {returncode}")
+        raise subprocess.CalledProcessError(returncode, command)
+
+
 def build_image(plan):
     """Build Docker image if it doesn't exist."""
     image_tag = f"hosting:{plan.lower()}"
     dockerfile_path = os.path.join(DOCKERFILES_DIR, PLANS[plan]["dockerfile"])
     print(f"Building Docker image {image_tag} from {dockerfile_path} ...")
-    run_command(f"docker build -t {image_tag} -f {dockerfile_path} {DOCKERFILES_DIR}")
+    # docker-py only drives the legacy builder, so use the CLI to get BuildKit
+    run_command_streaming(
+        ["docker", "build", "--progress=plain", "-t", image_tag, "-f", dockerfile_path, DOCKERFILES_DIR],
+        env={"DOCKER_BUILDKIT": "1", **os.environ},
+        prefix=f"[{image_tag}] ",
+    )
     return image_tag
 
 
+def build_images(plans):
+    """
+    Build the Docker images of several plans in parallel.
+    All builds run to completion; raises if any of them failed.
+    """
+    with ThreadPoolExecutor(max_workers=len(plans)) as executor:
+        futures = {plan: executor.submit(build_image, plan) for plan in plans}
+    failed = [plan for plan, future in futures.items() if future.exception()]
+    if failed:
+        raise RuntimeError(f"Failed to build images for plans: {', '.join(failed)}")
+    return [future.result() for future in futures.values()]
+
+
+def interface_exists(interface_name):
+    """Check whether a host network interface exists with one SIOCGIFFLAGS ioctl."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        try:
+            fcntl.ioctl(sock.fileno(), SIOCGIFFLAGS, struct.pack("256s", interface_name.encode()[:IFNAMSIZ - 1]))
+            return True
+        except OSError as e:
+            if e.errno == errno.ENODEV:
+                return False
+            raise
+
+
 def create_host_interface(subnet_cidr, interface_name="docknet0"):
     """Creates a host dummy interface with the subnet gateway IP."""
     try:
         base_ip = subnet_cidr.split("/")[0].rsplit(".", 1)[0]
         gateway_ip = f"{base_ip}.1/28"
 
-        # Check if interface exists
-        result = subprocess.run(f"ip addr show {interface_name}", shell=True)
-        if result.returncode != 0:
+        if not interface_exists(interface_name):
             print(f"Creating host interface {interface_name} with IP {gateway_ip} ...")
-            run_command(f"sudo ip link add {interface_name} type dummy")
-            run_command(f"sudo ip addr add {gateway_ip} dev {interface_name}")
-            run_command(f"sudo ip link set {interface_name} up")
+            if IPRoute is not None and os.geteuid() == 0:
+                address, prefixlen = gateway_ip.split("/")
+                with IPRoute() as ipr:
+                    ipr.link("add", ifname=interface_name, kind="dummy")
+                    index = ipr.link_lookup(ifname=interface_name)[0]
+                    ipr.addr("add", index=index, address=address, prefixlen=int(prefixlen))
+                    ipr.link("set", index=index, state="up")
+            else:
+                # Without pyroute2 (or root), fall back to the ip command via sudo
+                run_command(["sudo", "ip", "link", "add", interface_name, "type", "dummy"])
+                run_command(["sudo", "ip", "addr", "add", gateway_ip, "dev", interface_name])
+                run_command(["sudo", "ip", "link", "set", interface_name, "up"])
         else:
             print(f"Interface {interface_name} already exists.")
     except Exception as e:
@@ -71,17 +194,36 @@ def create_host_interface(subnet_cidr, interface_name="docknet0"):
         raise
 
 
+def network_exists(network_name):
+    """
+    Check for a Docker network with exactly this name.
+    Looking it up by name directly would also match network ID prefixes.
+    """
+    # The name filter matches substrings, so compare names exactly here
+    networks = request("GET", "/networks", params={"filters": json.dumps({"name": [network_name]})})
+    return any(network["Name"] == network_name for network in networks)
+
+
+def find_container_ids(name):
+    """
+    Return the IDs of containers (running or not) named exactly `name`.
+    Looking it up by name directly would also match container ID prefixes.
+    """
+    filters = json.dumps({"name": [f"^/{re.escape(name)}$"]})
+    containers = request("GET", "/containers/json", params={"all": True, "filters": filters})
+    return [c["Id"] for c in containers if f"/{name}" in c.get("Names", [])]
+
+
 def create_docker_network(network_name, subnet_cidr=None):
     """Creates a Docker bridge network. Subnet is optional."""
     try:
-        existing = subprocess.run(f"docker network ls --filter name=^{network_name}$ -q", shell=True, capture_output=True, text=True).stdout.strip()
-        if not existing:
+        if not network_exists(network_name):
             print(f"Creating Docker network '{network_name}' ...")
-            cmd = f"docker network create --driver=bridge {network_name}"
+            ipam = None
             if subnet_cidr:
-                 cmd = f"docker network create --driver=bridge --subnet={subnet_cidr} {network_name}"
-                 create_host_interface(subnet_cidr) # Create host interface if subnet is specified
-            run_command(cmd)
+                ipam = IPAMConfig(pool_configs=[IPAMPool(subnet=subnet_cidr)])
+                create_host_interface(subnet_cidr) # Create host interface if subnet is specified
+            docker_client.networks.create(network_name, driver="bridge", ipam=ipam)
         else:
             print(f"Docker network {network_name} already exists.")
     except Exception as e:
@@ -92,10 +234,12 @@ def create_docker_network(network_name, subnet_cidr=None):
 def remove_existing_container(name):
     """Remove existing container if exists."""
     try:
-        existing = subprocess.run(f"docker ps -a --filter name=^{name}$ -q", shell=True, capture_output=True, text=True).stdout.strip()
-        if existing:
+        container_ids = find_container_ids(name)
+        if container_ids:
             print(f"Removing existing container '{name}' ...")
-            run_command(f"docker rm -f {name}")
+            for container_id in container_ids:
+                # Delete by full ID, never by a name that could match an ID prefix
+                request("DELETE", "/containers/{0}", container_id, params={"force": True})
         else:
             print(f"No existing container named {name} found.")
     except Exception as e:
@@ -130,6 +274,10 @@ def create_container():
             print("Invalid plan. Please choose from vStart, vProfessional, vPopular, or vStable.")
             return
 
+        if not docker_client:
+            print("Docker client not initialized. Cannot create container.")
+            return
+
         # Build Docker image
         image_tag = build_image(plan)
 
@@ -143,38 +291,44 @@ def create_container():
         # Remove container if exists
         remove_existing_container(cname)
 
-        # Generate random ports
-        http_port = random_port(20000, 30000)
-        https_port = random_port(30001, 40000)
-        ssh_port = random_port(40001, 50000)
-        mysql_port = random_port(50001, 60000)
-
         print(f"\nRunning container {cname} for domain {domain} ...")
 
-        # Updated docker command without --ip flag
-        docker_cmd = (
-            f"docker run -d "
-            f"--name {cname} "
-            f"--hostname {domain} "
-            f"--cpus=\"{PLANS[plan]['cpu']}\" "
-            f"--memory=\"{PLANS[plan]['mem']}\" "
-            f"--net {network_name} "
-            f"-v {web_dir}:/home/{username}/www "
-            f"-e USERNAME={username} "
-            f"-e PASSWORD={password} "
-            f"-e DB_ADMIN_USER={db_admin_user} "
-            f"-e DB_ADMIN_PASS={db_admin_pass} "
-            f"-e DB_USER={db_user} "
-            f"-e DB_PASS={db_pass} "
-            f"-p {http_port}:80 "
-            f"-p {https_port}:443 "
-            f"-p {ssh_port}:22 "
-            f"-p {mysql_port}:3306 "
-            f"{image_tag}"
-        )
-
-        # Capture container ID from the output of the docker run command
-        container_id = run_command(docker_cmd)
+        for attempt in range(1, PORT_ATTEMPTS + 1):
+            # Explicit host ports, so they stay the same across container and daemon restarts
+            ports = pick_host_ports()
+            try:
+                container = docker_client.containers.run(
+                    image_tag,
+                    name=cname,
+                    hostname=domain,
+                    detach=True,
+                    nano_cpus=int(float(PLANS[plan]["cpu"]) * 1e9),
+                    mem_limit=PLANS[plan]["mem"],
+                    network=network_name,
+                    volumes={web_dir: {"bind": f"/home/{username}/www", "mode": "rw"}},
+                    environment={
+                        "USERNAME": username,
+                        "PASSWORD": password,
+                        "DB_ADMIN_USER": db_admin_user,
+                        "DB_ADMIN_PASS": db_admin_pass,
+                        "DB_USER": db_user,
+                        "DB_PASS": db_pass,
+                    },
+                    ports=ports,
+                )
+                break
+            except APIError as e:
+                if not is_port_conflict(e) or attempt == PORT_ATTEMPTS:
+                    raise
+                print(f"Host port already in use ({e}), retrying with other ports ...")
+                # The container was created before starting failed; remove it before retrying
+                remove_existing_container(cname)
+        container_id = container.id
+
+        http_port = ports["80/tcp"]
+        https_port = ports["443/tcp"]
+        ssh_port = ports["22/tcp"]
+        mysql_port = ports["3306/tcp"]
 
         print(f"""
         Container Created Successfully!
@@ -209,4 +363,11 @@ def create_container():
 
 
 if __name__ == "__main__":
-    create_container()
+    if "--build-all" in sys.argv[1:]:
+        try:
+            build_images(list(PLANS))
+        except Exception as e:
+            print(f"Error: {e}")
+            print("Please review the error message above to understand the issue and try again.")
+    else:
+        create_container()
@@ -10,28 +10,135 @@ import os
 import time
 import socket
 import psutil
-import docker
 import logging
-import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+from tabulate import tabulate
+
+from _docker_http import client as docker_client, request
 
 # =======================
 # Logging configuration
 # =======================
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Seconds between the two stats snapshots used to compute container CPU %
+CPU_SAMPLE_INTERVAL = 0.1
+
+# Fixed shape of a container status row, and the stats fields it is built from
+_KEYS = (
+    "container_id",
+    "container_name",
+    "status",
+    "container_cpu_%",
+    "container_mem_%",
+    "container_mem_usage_bytes",
+    "container_mem_limit_bytes",
+    "ports",
+)
+_cpu_get = itemgetter("cpu_usage", "system_cpu_usage", "online_cpus")
+_mem_get = itemgetter("usage", "limit")
+
 # =======================
-# Docker client setup
+# System CPU sampling
 # =======================
-try:
-    docker_client = docker.from_env()
-except Exception as e:
-    logging.warning(f"Could not initialize Docker client: {e}")
-    docker_client = None
+# Prime psutil's counter now; reading it again later returns the average CPU %
+# over the time spent collecting container stats, instead of a blocking 1s sleep
+psutil.cpu_percent(interval=None)
+_cpu_primed_at = time.monotonic()
 
 # =======================
 # Helper functions
 # =======================
 
+def net_io():
+    """
+    Return (bytes_received, bytes_sent) summed over all non-loopback interfaces.
+    Reads /proc/net/dev directly instead of going through psutil.net_io_counters().
+    """
+    rx = tx = 0
+    with open('/proc/net/dev') as f:
+        for line in f.readlines()[2:]: # Skip the two header lines
+            name, rest = line.split(':', 1)
+            if name.strip() == 'lo':
+                continue
+            cols = rest.split()
+            rx += int(cols[0])
+            tx += int(cols[8])
+    return rx, tx
+
+def _fetch_stats(c):
+    """
+    Fetch a single stats snapshot for a container.
+    Uses one-shot=true so the daemon skips its 1 second precpu pre-read.
+    """
+    return request("GET", "/containers/{0}/stats", c.id, params={"stream": False, "one-shot": True})
+
+
+def _container_details(c):
+    """
+    Collect stats and metadata for a single Docker container.
+    Returns a dictionary with container details and resource usage, or None on error.
+    """
+    try:
+        if c.status == 'running':
+            # One-shot snapshots have no precpu_stats, so take our own two samples
+            first_stats = _fetch_stats(c)
+            time.sleep(CPU_SAMPLE_INTERVAL)
+            stats = _fetch_stats(c)
+            # Calculate CPU %
+            cpu_percent = 0.0
+            try:
+                cpu_usage, system_cpu_usage, online_cpus = _cpu_get(stats["cpu_stats"])
+                precpu_usage, presystem_cpu_usage, _ = _cpu_get(first_stats["cpu_stats"])
+                cpu_delta = cpu_usage["total_usage"] - precpu_usage["total_usage"]
+                system_cpu_delta = system_cpu_usage - presystem_cpu_usage
+                if system_cpu_delta > 0 and online_cpus > 0:
+                    cpu_percent = (cpu_delta / system_cpu_delta) * online_cpus * 100
+            except KeyError:
+                pass # Incomplete CPU stats (e.g. container just started), report 0
+            try:
+                mem_usage, mem_limit = _mem_get(stats["memory_stats"])
+            except KeyError:
+                mem_usage, mem_limit = 0, 1
+            mem_percent = (mem_usage / mem_limit) * 100 if mem_limit else 0
+        else:
+            # For non-running containers, set resource usage to 0
+            cpu_percent = 0.0
+            mem_percent = 0.0
+            mem_usage = 0
+            mem_limit = 0
+
+
+        # Container metadata
+        ports = []
+        if c.attrs.get("NetworkSettings", {}).get("Ports"):
+            for port_name, port_binding in c.attrs["NetworkSettings"]["Ports"].items():
+                if port_binding:
+                    try:
+                        host_port = int(port_binding[0]["HostPort"])
+                        ports.append(f"{port_name}->{host_port}")
+                    except Exception:
+                        pass # Silently ignore invalid port bindings
+        else:
+            ports.append("N/A")
+
+
+        return dict(zip(_KEYS, (
+            c.id[:12],
+            c.name,
+            c.status,
+            round(cpu_percent, 2),
+            round(mem_percent, 2),
+            mem_usage,
+            mem_limit,
+            ", ".join(ports),
+        )))
+    except Exception as e:
+        logging.error(f"Error collecting stats for container {c.id[:12]}: {e}")
+        return None
+
+
 def collect_container_stats(all_containers=False):
     """
     Collect detailed stats and metadata for all (or running) Docker containers.
@@ -42,58 +149,13 @@ def collect_container_stats(all_containers=False):
         logging.info("Docker client not initialized. Skipping container stats collection.")
         return containers_details
     containers = docker_client.containers.list(all=all_containers)
-    for c in containers:
-        try:
-            if c.status == 'running':
-                stats = c.stats(stream=False)
-                 # Calculate CPU %
-                cpu_percent = 0.0
-                cpu_stats = stats.get("cpu_stats", {})
-                precpu_stats = stats.get("precpu_stats", {})
-                if cpu_stats and precpu_stats:
-                    cpu_delta = cpu_stats["cpu_usage"]["total_usage"] - precpu_stats["cpu_usage"]["total_usage"]
-                    system_cpu_delta = cpu_stats.get("system_cpu_usage", 0) - precpu_stats.get("system_cpu_usage", 0)
-                    online_cpus = cpu_stats.get("online_cpus") or len(cpu_stats["cpu_usage"].get("percpu_usage", [])) or 1
-                    if system_cpu_delta > 0 and online_cpus > 0:
-                        cpu_percent = (cpu_delta / system_cpu_delta) * online_cpus * 100
-                mem_usage = stats.get("memory_stats", {}).get("usage", 0)
-                mem_limit = stats.get("memory_stats", {}).get("limit", 1)
-                mem_percent = (mem_usage / mem_limit) * 100 if mem_limit else 0
-            else:
-                # For non-running containers, set resource usage to 0
-                cpu_percent = 0.0
-                mem_percent = 0.0
-                mem_usage = 0
-                mem_limit = 0
-
-
-            # Container metadata
-            ports = []
-            if c.attrs.get("NetworkSettings", {}).get("Ports"):
-                for port_name, port_binding in c.attrs["NetworkSettings"]["Ports"].items():
-                    if port_binding:
-                        try:
-                            host_port = int(port_binding[0]["HostPort"])
-                            ports.append(f"{port_name}->{host_port}")
-                        except Exception:
-                            pass # Silently ignore invalid port bindings
-            else:
-                ports.append("N/A")
-
-
-            containers_details.append({
-                "container_id": c.id[:12],
-                "container_name": c.name,
-                "status": c.status,
-                "container_cpu_%": round(cpu_percent, 2),
-                "container_mem_%": round(mem_percent, 2),
-                "container_mem_usage_bytes": mem_usage,
-                "container_mem_limit_bytes": mem_limit,
-                "ports": ", ".join(ports),
-
-            })
-        except Exception as e:
-            logging.error(f"Error collecting stats for container {c.id[:12]}: {e}")
+    if not containers:
+        return containers_details
+    # Each container needs two stats round-trips to the daemon, so fetch them concurrently
+    with ThreadPoolExecutor(max_workers=min(32, len(containers))) as executor:
+        for details in executor.map(_container_details, containers):
+            if details is not None:
+                containers_details.append(details)
     return containers_details
 
 # =======================
@@ -106,26 +168,30 @@ if __name__ == "__main__":
         print("=== SERVER AND CONTAINER MONITORING ===")
         print("="*30)
 
+        # Container Stats (including inactive), collected first so the system CPU
+        # sample covers this work instead of an idle second
+        container_data = collect_container_stats(all_containers=True)
+
         # System Stats
-        sys_cpu = psutil.cpu_percent(interval=1) # Interval for CPU percentage over 1 second
+        # Keep a minimum sampling window when there were no containers to collect
+        time.sleep(max(0.0, CPU_SAMPLE_INTERVAL - (time.monotonic() - _cpu_primed_at)))
+        sys_cpu = psutil.cpu_percent(interval=None) # Average since the counter was primed
         sys_mem = psutil.virtual_memory().percent
         sys_disk = psutil.disk_usage('/').percent
-        sys_net_io = psutil.net_io_counters()
+        net_recv, net_sent = net_io()
         hostname = os.getenv("HOSTNAME", socket.gethostname())
 
         print(f"\nServer: {hostname}")
         print(f"  CPU Usage: {sys_cpu}%")
         print(f"  Memory Usage: {sys_mem}%")
         print(f"  Disk Usage ('/'): {sys_disk}%")
-        print(f"  Network Sent: {sys_net_io.bytes_sent} bytes")
-        print(f"  Network Received: {sys_net_io.bytes_recv} bytes")
+        print(f"  Network Sent: {net_sent} bytes")
+        print(f"  Network Received: {net_recv} bytes")
 
         # Container Stats (including inactive)
         print("\nContainer Status and Usage:")
-        container_data = collect_container_stats(all_containers=True)
         if container_data:
-            df_containers = pd.DataFrame(container_data)
-            print(df_containers.to_markdown(index=False))
+            print(tabulate(container_data, headers="keys", tablefmt="github"))
         else:
             print("No Docker containers found or Docker client not initialized.")
 
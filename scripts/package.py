@@ -1,171 +1,268 @@
-import subprocess
+import codecs
+import re
+import selectors
+import shlex
+import socket
+import struct
 import sys
 import time
+import uuid
 
-def run_in_container(container_id, command):
+import docker
+
+from _docker_http import client as docker_client
+
+ALREADY_INSTALLED_MARKER = '__ALREADY_INSTALLED__'
+APT_UPDATED_MARKER = '__APT_UPDATED__'
+
+# Skip `apt-get update` if the package lists were refreshed this recently
+APT_UPDATE_MAX_AGE = 300 # seconds
+# Stamp file inside the container, so the cache survives restarts of this script
+APT_UPDATE_STAMP = '/var/run/container_apt_cache'
+
+# container_id -> time.time() of the last known `apt-get update`
+_apt_updated = {}
+
+# Stream ids in the multiplexed (non-TTY) exec stream
+STREAM_NAMES = {1: 'stdout', 2: 'stderr'}
+
+class ContainerShell:
     """
-    Run a command inside a Docker container and return the output.
-    Includes basic error handling and progress indication.
+    A long-lived /bin/bash session inside a container, opened through the Docker
+    Engine API exec endpoints. Commands are written into the same shell, so the
+    exec setup cost is paid once per session instead of once per command.
+    The hijacked exec socket carries stdout and stderr as multiplexed frames and
+    is watched with a selector (epoll on Linux).
     """
-    try:
-        process = subprocess.Popen(
-            ['docker', 'exec', container_id] + command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        stdout, stderr = process.communicate()
-        return stdout, stderr, process.returncode
-    except Exception as e:
-        return str(e), None, 1 # Return an error code
 
-def install_package(container_id, package_name):
+    def __init__(self, container_id):
+        self.container_id = container_id
+        api = docker_client.api
+        self._exec_id = api.exec_create(
+            container_id, ['/bin/bash'], stdin=True, stdout=True, stderr=True
+        )['Id']
+        self._socket = api.exec_start(self._exec_id, socket=True)
+        # docker-py hands back a SocketIO wrapper around the raw socket
+        self._sock = getattr(self._socket, '_sock', self._socket)
+        self._sentinel = f'__DONE_{uuid.uuid4().hex}__'
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._sock, selectors.EVENT_READ)
+        self._buffer = b''
+        self._decoders = {name: codecs.getincrementaldecoder('utf-8')(errors='replace') for name in STREAM_NAMES.values()}
+        self._pending = {name: '' for name in STREAM_NAMES.values()}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _read_lines(self):
+        """
+        Read the frames currently available on the exec socket.
+        Both '\n' and '\r' end a line, so progress bars are echoed as they update.
+        Returns ([(stream name, line), ...], eof).
+        """
+        data = self._sock.recv(65536)
+        eof = not data
+        self._buffer += data
+        texts = {name: '' for name in STREAM_NAMES.values()}
+        # Frame header: stream id (1 byte), 3 bytes padding, payload size (4 bytes, big endian)
+        while len(self._buffer) >= 8:
+            stream_id, size = struct.unpack('>BxxxL', self._buffer[:8])
+            if len(self._buffer) < 8 + size:
+                break
+            payload, self._buffer = self._buffer[8:8 + size], self._buffer[8 + size:]
+            name = STREAM_NAMES.get(stream_id)
+            if name:
+                texts[name] += self._decoders[name].decode(payload)
+
+        lines = []
+        for name, text in texts.items():
+            parts = re.split(r'(?<=[\r\n])', self._pending[name] + text)
+            self._pending[name] = parts.pop()
+            if eof and self._pending[name]:
+                parts.append(self._pending[name])
+                self._pending[name] = ''
+            lines.extend((name, part) for part in parts if part)
+        return lines, eof
+
+    def run(self, command, on_stdout_line=None):
+        """
+        Run a command (list of arguments or shell string) in the shell.
+        Output is echoed live; returns (stdout, stderr, returncode).
+        """
+        if not isinstance(command, str):
+            command = shlex.join(command)
+        on_stdout_line = on_stdout_line or sys.stdout.write
+        sentinel = self._sentinel
+
+        # Run in a subshell so `exit` does not end the session, without stdin so
+        # the command cannot swallow the ones that follow it
+        try:
+            self._sock.sendall(
+                f'( {command}\n) </dev/null; echo "{sentinel}$?"; echo "{sentinel}" >&2\n'.encode()
+            )
+        except OSError as e:
+            return '', f'Container shell is not running: {e}', 1
+
+        stdout, stderr = [], []
+        returncode = None
+        stderr_done = False
+        shell_exited = False
+        while (returncode is None or not stderr_done) and not shell_exited:
+            self._selector.select()
+            lines, shell_exited = self._read_lines()
+            for name, line in lines:
+                marker = line.find(sentinel)
+                if marker >= 0:
+                    line, status = line[:marker], line[marker + len(sentinel):].strip()
+                    if name == 'stdout':
+                        returncode = int(status)
+                    else:
+                        stderr_done = True
+                if not line:
+                    continue
+                if name == 'stdout':
+                    stdout.append(line)
+                    on_stdout_line(line)
+                else:
+                    stderr.append(line)
+                    sys.stderr.write(line)
+            sys.stdout.flush()
+            sys.stderr.flush()
+
+        if returncode is None:
+            stderr.append('Container shell exited unexpectedly.\n')
+            returncode = 1
+        return ''.join(stdout), ''.join(stderr), returncode
+
+    def close(self):
+        """End the shell session."""
+        try:
+            # EOF on stdin makes bash exit
+            self._sock.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+        self._selector.close()
+        self._socket.close()
+        self._sock.close()
+
+def install_package(shell, package_name):
     """
     Install a package inside the container by package name.
+    Several whitespace-separated names are installed in one apt transaction.
     Includes progress bar, checks if package is already installed, and suggests alternatives.
     """
-    print(f"Checking if {package_name} is already installed...")
-    check_command = ['dpkg', '-s', package_name]
-    stdout, stderr, returncode = run_in_container(container_id, check_command)
-
-    if returncode == 0:
-        print(f"Package {package_name} is already installed.")
+    container_id = shell.container_id
+    package_names = package_name.split()
+    if not package_names:
+        print("Error: no package name given.")
         return
-
-    print(f"Updating package lists for {container_id}...")
-    command_update = ['apt-get', 'update']
-    stdout, stderr, returncode = run_in_container(container_id, command_update)
-    if returncode != 0:
-        print(f"Error updating package lists: {stderr}")
-        return
-
-    print(f"Installing package {package_name} in {container_id}...")
-    command_install = ['apt-get', 'install', '-y', package_name]
-    process = subprocess.Popen(
-        ['docker', 'exec', container_id] + command_install,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True
+    print(f"Checking, updating package lists and installing {package_name} in {container_id}...")
+    # Check, update and install in a single docker exec
+    quoted = ' '.join(shlex.quote(name) for name in package_names)
+    if time.time() - _apt_updated.get(container_id, 0) < APT_UPDATE_MAX_AGE:
+        update_step = ''
+    else:
+        # Only update if the stamp in the container is missing or stale
+        update_step = (
+            f'[ -n "$(find {APT_UPDATE_STAMP} -mmin -{APT_UPDATE_MAX_AGE // 60} 2>/dev/null)" ] '
+            f'|| {{ apt-get update && touch {APT_UPDATE_STAMP} && echo {APT_UPDATED_MARKER}; }} || exit $?; '
+        )
+    command_install = (
+        f'dpkg -s {quoted} >/dev/null 2>&1 && echo {ALREADY_INSTALLED_MARKER} && exit 0; '
+        f'{update_step}apt-get install -y {quoted}'
     )
 
-    # Simple progress indication
-    while True:
-        output = process.stdout.readline()
-        if output == '' and process.poll() is not None:
-            break
-        if output:
-            sys.stdout.write(output)
-            sys.stdout.flush()
+    # Simple progress indication, hiding the markers
+    def echo_line(line):
+        if line.strip() not in (ALREADY_INSTALLED_MARKER, APT_UPDATED_MARKER):
+            sys.stdout.write(line)
 
-    stdout, stderr = process.communicate()
-    returncode = process.returncode
+    stdout, stderr, returncode = shell.run(command_install, echo_line)
+    output_lines = stdout.split()
+    already_installed = ALREADY_INSTALLED_MARKER in output_lines
+    # Only a real `apt-get update` resets the cache age, not a fresh stamp in the container
+    if APT_UPDATED_MARKER in output_lines:
+        _apt_updated[container_id] = time.time()
 
-    if returncode != 0:
-        print(f"Error installing package {package_name}: {stderr}")
+    if already_installed:
+        print(f"Package {package_name} is already installed.")
+    elif returncode != 0:
+        # stderr was already echoed live by shell.run
+        print(f"Error installing package {package_name} (see output above).")
         # Suggest alternatives if package not found (basic check)
-        if "Unable to locate package" in stderr or "Package '" in stderr and "' has no installation candidate" in stderr:
-             print(f"Package '{package_name}' not found. Did you mean?")
-             search_command = ['apt-cache', 'search', package_name]
-             stdout, stderr, returncode = run_in_container(container_id, search_command)
-             if returncode == 0:
-                 print(stdout)
-             else:
+        not_found = [
+            name for name in package_names
+            if f"Unable to locate package {name}" in stderr or f"Package '{name}' has no installation candidate" in stderr
+        ]
+        for name in not_found:
+             print(f"Package '{name}' not found. Did you mean?")
+             search_command = ['apt-cache', 'search', name]
+             # Search results are echoed live by shell.run
+             stdout, stderr, returncode = shell.run(search_command)
+             if returncode != 0:
                  print("Could not search for similar packages.")
     else:
         print(f"Package {package_name} installed successfully!")
 
-def install_package_from_url(container_id, package_url):
+def install_package_from_url(shell, package_url):
     """
     Install a package inside the container from a URL (assumed .deb file).
     Includes progress bar for download and installation.
     """
+    container_id = shell.container_id
     print(f"Downloading package from URL {package_url} to {container_id}...")
     command_download = ['wget', '--quiet', '--show-progress', package_url, '-O', '/tmp/package.deb']
 
-    process_download = subprocess.Popen(
-        ['docker', 'exec', container_id] + command_download,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True
-    )
-
-    # Simple progress indication for download
-    while True:
-        output = process_download.stderr.readline() # wget often prints progress to stderr
-        if output == '' and process_download.poll() is not None:
-            break
-        if output:
-            sys.stderr.write(output)
-            sys.stderr.flush()
-
-
-    stdout_download, stderr_download = process_download.communicate()
-    returncode_download = process_download.returncode
+    # Simple progress indication for download (wget prints progress to stderr)
+    stdout_download, stderr_download, returncode_download = shell.run(command_download)
 
     if returncode_download != 0:
-        print(f"Error downloading package from URL {package_url}: {stderr_download}")
+        print(f"Error downloading package from URL {package_url} (see output above).")
         return
 
     print(f"Installing package from /tmp/package.deb in {container_id}...")
-    # Correcting the command to use separate calls or a single command string with shell=True
-    command_install = ['/bin/bash', '-c', 'dpkg -i /tmp/package.deb && apt-get install -f -y']
-
-
-    process_install = subprocess.Popen(
-        ['docker', 'exec', container_id] + command_install,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True
-    )
+    command_install = 'dpkg -i /tmp/package.deb && apt-get install -f -y'
 
     # Simple progress indication for installation
-    while True:
-        output = process_install.stdout.readline()
-        if output == '' and process_install.poll() is not None:
-            break
-        if output:
-            sys.stdout.write(output)
-            sys.stdout.flush()
-
-    stdout_install, stderr_install = process_install.communicate()
-    returncode_install = process_install.returncode
+    stdout_install, stderr_install, returncode_install = shell.run(command_install)
 
 
     if returncode_install != 0:
-        print(f"Error installing package from URL {package_url}: {stderr_install}")
+        print(f"Error installing package from URL {package_url} (see output above).")
     else:
         print(f"Package installed from URL: {package_url}")
 
-def download_file(container_id, file_url, container_path):
+def download_file(shell, file_url, container_path):
     """
     Download a file from a URL and save it to the specified container path.
+    Several whitespace-separated URLs are downloaded concurrently in one exec.
     Includes progress bar for download.
     """
-    print(f"Downloading file from {file_url} to {container_id}:{container_path}...")
-    # Use wget with quiet mode and show progress
-    command_download = ['wget', '--quiet', '--show-progress', file_url, '-P', container_path]
-
-    process_download = subprocess.Popen(
-        ['docker', 'exec', container_id] + command_download,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True
-    )
-
-    # Simple progress indication for download
-    while True:
-        output = process_download.stderr.readline() # wget often prints progress to stderr
-        if output == '' and process_download.poll() is not None:
-            break
-        if output:
-            sys.stderr.write(output)
-            sys.stderr.flush()
+    file_urls = file_url.split()
+    if not file_urls:
+        print("Error: no file URL given.")
+        return
+    print(f"Downloading file from {file_url} to {shell.container_id}:{container_path}...")
+    if len(file_urls) == 1:
+        # Use wget with quiet mode and show progress
+        command_download = ['wget', '--quiet', '--show-progress', file_urls[0], '-P', container_path]
+    else:
+        # Start one background wget per URL and wait for all of them; progress bars
+        # would interleave, so each download only reports a line when it finishes
+        jobs = ''.join(
+            f'wget --no-verbose {shlex.quote(url)} -P {shlex.quote(container_path)} & pids="$pids $!"; '
+            for url in file_urls
+        )
+        command_download = f'pids=""; {jobs}rc=0; for pid in $pids; do wait $pid || rc=1; done; exit $rc'
 
-    stdout_download, stderr_download = process_download.communicate()
-    returncode_download = process_download.returncode
+    # Simple progress indication for download (wget prints progress to stderr)
+    stdout_download, stderr_download, returncode_download = shell.run(command_download)
 
     if returncode_download != 0:
-        print(f"Error downloading file from {file_url}: {stderr_download}")
+        print(f"Error downloading file from {file_url} (see output above).")
     else:
         print(f"File downloaded successfully to {container_path}")
 
@@ -174,6 +271,20 @@ def main():
     # Get container ID from user
     container_id = input("Enter the container ID: ")
 
+    if not docker_client:
+        print("Docker client not initialized. Cannot manage packages.")
+        return
+
+    # One shell for the whole session instead of an exec per command
+    try:
+        shell = ContainerShell(container_id)
+    except docker.errors.APIError as e:
+        print(f"Could not open a shell in container {container_id}: {e}")
+        return
+    with shell:
+        menu(shell)
+
+def menu(shell):
     while True:
         print("\nSelect an option:")
         print("1. Install package by name")
@@ -184,23 +295,23 @@ def main():
         choice = input("Enter your choice: ")
 
         if choice == '1':
-            package_name = input("Enter the package name to install: ")
-            install_package(container_id, package_name)
+            package_name = input("Enter the package name(s) to install (space-separated): ")
+            install_package(shell, package_name)
 
         elif choice == '2':
             package_url = input("Enter the URL of the package (.deb file): ")
             confirm = input(f"Do you want to install the package from {package_url}? (yes/no): ").lower()
             if confirm == 'yes':
-                install_package_from_url(container_id, package_url)
+                install_package_from_url(shell, package_url)
             else:
                 print("Package installation cancelled.")
 
         elif choice == '3':
-            file_url = input("Enter the URL of the file to download: ")
+            file_url = input("Enter the URL(s) of the file(s) to download (space-separated): ")
             container_path = input("Enter the path inside the container to save the file: ")
             confirm = input(f"Do you want to download the file from {file_url} to {container_path}? (yes/no): ").lower()
             if confirm == 'yes':
-                download_file(container_id, file_url, container_path)
+                download_file(shell, file_url, container_path)
             else:
                 print("File download cancelled.")
 